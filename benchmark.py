@@ -0,0 +1,67 @@
+import time
+import numpy as np
+
+from src.processing.process_spectra import resample_spectrum, normalize_spectrum, calculate_log_likelihood
+from src.processing.fused_kernel import NUMBA_AVAILABLE, compute_log_likelihoods, wavelength_window
+
+def make_synthetic_data(n_models=200, n_obs_pix=3900, n_model_pix=200000, seed=0):
+    """生成与 LAMOST/PHOENIX 规模相近的合成数据."""
+    rng = np.random.default_rng(seed)
+    model_wave = np.linspace(3000.0, 10000.0, n_model_pix)
+    model_fluxes = 1.0 + 0.1 * rng.standard_normal((n_models, n_model_pix))
+    model_fluxes[:, ::997] = np.nan # 模拟模型中的坏点
+
+    obs_wave = np.sort(rng.uniform(3690.0, 9100.0, n_obs_pix))
+    obs_flux_norm = normalize_spectrum(1.0 + 0.1 * rng.standard_normal(n_obs_pix))
+    obs_ivar = rng.uniform(10.0, 100.0, n_obs_pix)
+    return obs_wave, obs_flux_norm, obs_ivar, model_wave, model_fluxes
+
+def run_reference(obs_wave, obs_flux_norm, obs_ivar, model_wave, model_fluxes):
+    """现有逐模型路径: resample -> normalize -> calculate_log_likelihood."""
+    log_likelihoods = np.empty(len(model_fluxes))
+    n_valids = np.empty(len(model_fluxes), dtype=np.int64)
+    for i, model_flux in enumerate(model_fluxes):
+        model_flux_norm = normalize_spectrum(resample_spectrum(obs_wave, model_wave, model_flux))
+        log_likelihoods[i], n_valids[i] = calculate_log_likelihood(obs_flux_norm, obs_ivar, model_flux_norm)
+    return log_likelihoods, n_valids
+
+def run_fused(obs_wave, obs_flux_norm, obs_ivar, model_wave, model_fluxes, use_numba):
+    """fused 路径: 整批计算 (模型已按观测范围裁剪，与 worker 中载入时的处理一致)."""
+    return compute_log_likelihoods(obs_wave, obs_flux_norm, obs_ivar, model_wave, model_fluxes, use_numba=use_numba)
+
+def timed(func, *args, repeat=3, **kwargs):
+    """返回多次运行中的最短耗时及最后一次的结果."""
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    data = make_synthetic_data()
+    n_models = len(data[4])
+    print(f"模型数: {n_models}, 观测像素: {len(data[0])}, 模型像素: {data[3].shape[0]}")
+
+    ref_time, (ref_logl, ref_nvalid) = timed(run_reference, *data)
+    print(f"逐模型路径 (scipy interp1d): {ref_time:.3f} s ({ref_time / n_models * 1e3:.2f} ms/模型)")
+
+    obs_wave, obs_flux_norm, obs_ivar, model_wave, model_fluxes = data
+    window = wavelength_window(obs_wave, model_wave)
+    data = (obs_wave, obs_flux_norm, obs_ivar, model_wave[window], np.ascontiguousarray(model_fluxes[:, window]))
+
+    variants = [('fused NumPy', False)]
+    if NUMBA_AVAILABLE:
+        run_fused(*data, use_numba=True) # 预热，排除 JIT 编译时间
+        variants.append(('fused numba', True))
+    else:
+        print("未安装 numba，跳过编译内核的测试。")
+
+    for name, use_numba in variants:
+        elapsed, (logl, nvalid) = timed(run_fused, *data, use_numba=use_numba)
+        max_rel_err = np.max(np.abs(logl - ref_logl) / np.abs(ref_logl))
+        print(f"{name}: {elapsed:.3f} s (加速 {ref_time / elapsed:.1f}x), "
+              f"最大相对误差 {max_rel_err:.2e}, 有效像素一致: {np.array_equal(nvalid, ref_nvalid)}")
+
+if __name__ == "__main__":
+    main()
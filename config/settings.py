@@ -17,9 +17,25 @@ MIN_VALID_PIXELS = 100 # 处理光谱所需的最少有效像素点
 WAVE_INTERPOLATE_BOUNDS_ERROR = False # 插值时是否因超出边界而报错
 WAVE_INTERPOLATE_FILL_VALUE = np.nan # 插值超出边界时的填充值
 
+# --- fused 似然内核 ---
+# 启用后按批一次性完成 重采样 -> 归一化 -> 卡方 计算；安装了 numba 时使用编译内核，否则使用 NumPy 实现
+# 仅在 WAVE_INTERPOLATE_BOUNDS_ERROR = False 时生效
+# numba 内核在每个工作进程内的线程数由下方的 FUSED_KERNEL_NUM_THREADS 控制
+USE_FUSED_KERNEL = True
+FUSED_KERNEL_BATCH_SIZE = 64 # 每批同时载入内存的 PHOENIX 模型数
+
+# --- 任务规划 ---
+# 'catalog': 先在星表上按 TARGET_CLASS/MIN_SNRG 筛选，再直接检查对应光谱文件是否存在 (启动耗时随目标数增长)
+# 'scan': 扫描 LAMOST_SPECTRA_DIR 下的全部文件，再与星表匹配并筛选 (启动耗时随目录大小增长)
+TASK_PLANNING_MODE = 'catalog'
+PATH_CHECK_THREADS = 16 # catalog 模式下检查文件是否存在的线程数，设为 1 则不使用线程池
+
 # --- 多进程配置 ---
 # 使用 CPU 核心数减 1，留一个核心给系统, 最少为 1
 NUM_PROCESSES = max(1, os.cpu_count() - 1 if os.cpu_count() else 1)
+# 每个工作进程内 numba fused 内核的线程数。内核运行在多进程池中，
+# 默认将 CPU 核心均分给各进程 (默认配置下为 1)，避免 进程数 x 线程数 超额占用 CPU
+FUSED_KERNEL_NUM_THREADS = max(1, (os.cpu_count() or 1) // NUM_PROCESSES)
 
 # --- 限制处理数量 (用于测试) ---
 # 设置为 None 则处理所有通过筛选的光谱
@@ -1,6 +1,7 @@
 import os
 import re
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from astropy.io import fits
 from astropy.table import Table
 import numpy as np
@@ -93,6 +94,122 @@ def scan_and_parse_lamost_spectra(spectra_dir):
         return None
     return available_spectra
 
+def select_lamost_targets(catalog, target_class, min_snrg):
+    r"""直接在星表列上按 class/snrg 筛选，返回通过筛选的行索引数组."""
+    required_cols = ['class', 'snrg']
+    if not all(col in catalog.colnames for col in required_cols):
+        logging.error(f"星表缺少筛选所需的列: {required_cols}")
+        return None
+
+    try:
+        class_clean = np.char.strip(np.asarray(catalog['class']).astype(str))
+        snrg = np.asarray(catalog['snrg'], dtype=np.float64)
+    except (ValueError, TypeError) as e:
+        logging.error(f"读取星表 class/snrg 列时出错: {e}")
+        return None
+
+    with np.errstate(invalid='ignore'):
+        selected = (class_clean == target_class) & np.isfinite(snrg) & (snrg > min_snrg)
+    row_indices = np.flatnonzero(selected)
+    logging.info(f"星表筛选完成: {len(row_indices)} / {len(catalog)} 条记录满足 class={target_class}, snrg>{min_snrg}。")
+    return row_indices
+
+def _find_existing_spectra(candidate_paths):
+    r"""对一批候选路径依次 stat，返回每组中第一个存在的文件路径 (均不存在则为 None)."""
+    return [next((path for path in paths if os.path.isfile(path)), None) for paths in candidate_paths]
+
+def locate_lamost_spectra_from_catalog(catalog, row_indices, spectra_dir, max_spectra=None, num_threads=1, batch_size=1024):
+    r"""根据星表行推导预期的光谱文件路径并确认其存在，返回与 scan_and_parse_lamost_spectra 相同格式的列表.
+
+    只检查 row_indices 对应的文件，不列出整个目录。每条记录额外包含 'row_index' (星表行号)。
+
+    Args:
+        catalog (Table): LAMOST 星表。
+        row_indices (np.ndarray): 需要查找光谱的星表行索引 (通常来自 select_lamost_targets)。
+        spectra_dir (str): LAMOST 光谱目录。
+        max_spectra (int or None): 找到的光谱数达到该值后停止检查。
+        num_threads (int): 并行执行 stat 的线程数，小于等于 1 时在当前线程中执行。
+        batch_size (int): 每轮检查的星表行数。
+    """
+    logging.info(f"开始根据星表查找 LAMOST 光谱文件: {spectra_dir}")
+    required_cols = ['lmjd', 'planid', 'spid', 'fiberid']
+    if not all(col in catalog.colnames for col in required_cols):
+        logging.error(f"星表缺少推导光谱文件名所需的列: {required_cols}")
+        return None
+    if not os.path.isdir(spectra_dir):
+        logging.error(f"LAMOST 光谱目录不存在: {spectra_dir}")
+        return None
+
+    # 只处理筛选出的行，避免对整个星表的 planid 列做字符串操作
+    row_indices = np.asarray(row_indices, dtype=np.int64)
+    planid_clean = np.char.strip(np.asarray(catalog['planid'][row_indices]).astype(str))
+
+    # 推导每个目标的文件名，重复的 (lmjd, planid, spid, fiberid) 只保留第一次出现的行
+    candidates = []
+    seen_keys = set()
+    for pos, i in enumerate(row_indices):
+        try:
+            key = (int(catalog['lmjd'][i]), planid_clean[pos], int(catalog['spid'][i]), int(catalog['fiberid'][i]))
+        except (ValueError, TypeError) as e:
+            logging.warning(f"推导光谱文件名时跳过行 {i}: 无法处理键值. Error: {e}")
+            continue
+        if key in seen_keys:
+            continue
+        seen_keys.add(key)
+        candidates.append((int(i), key))
+
+    available_spectra = []
+    n_missing = 0
+    executor = ThreadPoolExecutor(max_workers=num_threads) if num_threads > 1 else None
+    try:
+        with tqdm(total=len(candidates), desc="检查光谱文件") as progress:
+            for start in range(0, len(candidates), batch_size):
+                batch = candidates[start:start + batch_size]
+                candidate_paths = []
+                for _, (lmjd, planid, spid, fiberid) in batch:
+                    filepath = os.path.join(spectra_dir, f"spec-{lmjd}-{planid}_sp{spid:02d}-{fiberid:03d}.fits")
+                    candidate_paths.append((filepath, filepath + '.gz'))
+
+                if executor is None:
+                    found_paths = _find_existing_spectra(candidate_paths)
+                else:
+                    # 按线程数切成连续的小批，保持结果顺序与星表一致
+                    chunk_size = -(-len(candidate_paths) // num_threads)
+                    chunks = [candidate_paths[j:j + chunk_size] for j in range(0, len(candidate_paths), chunk_size)]
+                    found_paths = [path for chunk in executor.map(_find_existing_spectra, chunks) for path in chunk]
+                progress.update(len(batch))
+
+                for (row_index, (lmjd, planid, spid, fiberid)), filepath in zip(batch, found_paths):
+                    if filepath is None:
+                        n_missing += 1
+                        continue
+                    available_spectra.append({
+                        'lmjd': lmjd,
+                        'planid': planid,
+                        'spid': spid,
+                        'fiberid': fiberid,
+                        'filepath': filepath,
+                        'is_compressed': filepath.endswith('.gz'),
+                        'row_index': row_index
+                    })
+                    if max_spectra is not None and len(available_spectra) >= max_spectra:
+                        break
+                if max_spectra is not None and len(available_spectra) >= max_spectra:
+                    logging.info(f"已找到 {max_spectra} 个光谱文件，停止检查剩余目标。")
+                    break
+    except Exception as e:
+        logging.error(f"根据星表查找 LAMOST 光谱文件时出错: {e}")
+        return None
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    logging.info(f"查找完成，找到 {len(available_spectra)} 个光谱文件，{n_missing} 个目标在目录中没有对应文件。")
+    if not available_spectra:
+        logging.warning("星表筛选出的目标在目录中均未找到对应的 LAMOST 光谱文件。")
+        return None
+    return available_spectra
+
 def load_lamost_spectrum(filepath, obsid_for_log="未知"):
     r"""加载单个 LAMOST 光谱文件，返回 flux, ivar, wave, mask.
 
@@ -0,0 +1,208 @@
+import logging
+import numpy as np
+
+# numba 为可选依赖，缺失时退回到向量化的 NumPy 实现
+try:
+    from numba import config as numba_config, njit, prange, set_num_threads
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+def _interpolation_indices(target_wave, source_wave):
+    r"""计算线性插值所用的裁剪后目标波长及左端点索引 (与 np.interp 的取点方式一致)."""
+    target_wave_clipped = np.clip(target_wave, source_wave[0], source_wave[-1])
+    lo_indices = np.searchsorted(source_wave, target_wave_clipped, side='right') - 1
+    lo_indices = np.clip(lo_indices, 0, len(source_wave) - 2).astype(np.int64)
+    return target_wave_clipped, lo_indices
+
+
+def _fused_log_likelihood_numpy(obs_wave, obs_flux_norm, obs_ivar, model_wave, model_fluxes):
+    r"""fused 内核的纯 NumPy 版本，一次性对整批模型完成重采样、归一化与卡方计算."""
+    target_wave_clipped, lo = _interpolation_indices(obs_wave, model_wave)
+    hi = lo + 1
+    y_lo = model_fluxes[:, lo]
+    y_hi = model_fluxes[:, hi]
+
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        # 与 np.interp (interp1d 线性插值的实际实现) 相同的公式及 NaN 回退规则
+        slope = (y_hi - y_lo) / (model_wave[hi] - model_wave[lo])
+        model_resampled = slope * (target_wave_clipped - model_wave[lo]) + y_lo
+        retry = np.isnan(model_resampled)
+        model_resampled[retry] = (slope * (target_wave_clipped - model_wave[hi]) + y_hi)[retry]
+        retry = np.isnan(model_resampled) & (y_lo == y_hi)
+        model_resampled[retry] = y_lo[retry]
+        # 恰好落在模型网格点上时直接取该点的值
+        on_grid = target_wave_clipped == model_wave[lo]
+        model_resampled[:, on_grid] = y_lo[:, on_grid]
+        at_end = target_wave_clipped == model_wave[-1]
+        model_resampled[:, at_end] = model_fluxes[:, -1:]
+
+        # 与 normalize_spectrum 相同: 中值无效时保留原始流量
+        finite_rows = ~np.all(np.isnan(model_resampled), axis=1)
+        medians = np.full(len(model_fluxes), np.nan)
+        if np.any(finite_rows):
+            medians[finite_rows] = np.nanmedian(model_resampled[finite_rows], axis=1)
+        scale = np.where((medians > 0) & np.isfinite(medians), medians, 1.0)
+        model_flux_norm = model_resampled / scale[:, None]
+
+        valid = np.isfinite(obs_flux_norm) & (obs_ivar > 0) & np.isfinite(model_flux_norm)
+        n_valid = np.sum(valid, axis=1)
+        chi2 = np.sum(np.where(valid, ((obs_flux_norm - model_flux_norm) ** 2) * obs_ivar, 0.0), axis=1)
+
+    usable = (n_valid > 0) & np.isfinite(chi2) & (chi2 >= 0)
+    log_likelihoods = np.where(usable, -0.5 * chi2, -np.inf)
+    return log_likelihoods, n_valid
+
+
+if NUMBA_AVAILABLE:
+
+    @njit(cache=True)
+    def _median_inplace(values, n):
+        r"""用快速选择求 values[:n] 的中值，会原地打乱 values."""
+        k = n // 2
+        left = 0
+        right = n - 1
+        while left < right:
+            pivot = values[(left + right) // 2]
+            i = left
+            j = right
+            while i <= j:
+                while values[i] < pivot:
+                    i += 1
+                while values[j] > pivot:
+                    j -= 1
+                if i <= j:
+                    tmp = values[i]
+                    values[i] = values[j]
+                    values[j] = tmp
+                    i += 1
+                    j -= 1
+            if k <= j:
+                right = j
+            elif k >= i:
+                left = i
+            else:
+                break
+        upper = values[k]
+        if n % 2 == 1:
+            return upper
+        # 选择完成后 values[:k] 均不大于 values[k]，其最大值即为下中位数
+        lower = values[0]
+        for i in range(1, k):
+            if values[i] > lower:
+                lower = values[i]
+        return (lower + upper) / 2.0
+
+    @njit(cache=True, inline='always')
+    def _interpolate_at(flux, model_wave, x, lo):
+        r"""按 np.interp 的规则计算单个像素的插值结果."""
+        n_src = model_wave.shape[0]
+        y_lo = flux[lo]
+        y_hi = flux[lo + 1]
+        if x == model_wave[n_src - 1]:
+            return flux[n_src - 1]
+        if x == model_wave[lo]:
+            return y_lo
+        slope = (y_hi - y_lo) / (model_wave[lo + 1] - model_wave[lo])
+        value = slope * (x - model_wave[lo]) + y_lo
+        if np.isnan(value):
+            value = slope * (x - model_wave[lo + 1]) + y_hi
+            if np.isnan(value) and y_lo == y_hi:
+                value = y_lo
+        return value
+
+    @njit(parallel=True, cache=True)
+    def _fused_log_likelihood_numba(obs_wave_clipped, lo_indices, obs_flux_norm, obs_ivar, model_wave, model_fluxes):
+        r"""在模型维度上并行，逐像素完成插值、中值归一化与卡方累加.
+
+        中值需要看到全部插值结果，因此每个模型使用一个长度为 n_pix 的缓冲区:
+        第一遍插值并收集非 NaN 值求中值，第二遍重新插值并累加卡方，不保存重采样后的流量。
+        """
+        n_models = model_fluxes.shape[0]
+        n_pix = obs_wave_clipped.shape[0]
+        log_likelihoods = np.empty(n_models)
+        n_valid = np.zeros(n_models, dtype=np.int64)
+
+        for m in prange(n_models):
+            flux = model_fluxes[m]
+            scratch = np.empty(n_pix)
+            n_not_nan = 0
+            for i in range(n_pix):
+                value = _interpolate_at(flux, model_wave, obs_wave_clipped[i], lo_indices[i])
+                if not np.isnan(value):
+                    scratch[n_not_nan] = value
+                    n_not_nan += 1
+
+            scale = 1.0
+            if n_not_nan > 0:
+                median = _median_inplace(scratch, n_not_nan)
+                if median > 0 and np.isfinite(median):
+                    scale = median
+
+            chi2 = 0.0
+            count = 0
+            for i in range(n_pix):
+                model_value = _interpolate_at(flux, model_wave, obs_wave_clipped[i], lo_indices[i]) / scale
+                if np.isfinite(obs_flux_norm[i]) and np.isfinite(model_value) and obs_ivar[i] > 0:
+                    diff = obs_flux_norm[i] - model_value
+                    chi2 += diff * diff * obs_ivar[i]
+                    count += 1
+
+            n_valid[m] = count
+            if count == 0 or not np.isfinite(chi2) or chi2 < 0:
+                log_likelihoods[m] = -np.inf
+            else:
+                log_likelihoods[m] = -0.5 * chi2
+
+        return log_likelihoods, n_valid
+
+
+def compute_log_likelihoods(obs_wave, obs_flux_norm, obs_ivar, model_wave, model_fluxes, use_numba=True):
+    r"""对一批模型一次性计算对数似然，等价于逐个调用 resample/normalize/calculate_log_likelihood.
+
+    模型波长需单调递增，观测波长按 WAVE_INTERPOLATE_BOUNDS_ERROR=False 的方式裁剪到模型范围内。
+
+    Args:
+        obs_wave (np.ndarray): 观测波长。
+        obs_flux_norm (np.ndarray): 归一化的观测流量。
+        obs_ivar (np.ndarray): 对应的逆方差。
+        model_wave (np.ndarray): 模型波长 (单调递增)。
+        model_fluxes (np.ndarray): 模型流量，形状为 (模型数, len(model_wave))。
+        use_numba (bool): numba 可用时是否使用编译内核。
+
+    Returns:
+        tuple: (各模型的对数似然数组, 各模型的有效像素点数数组)。
+    """
+    obs_wave = np.ascontiguousarray(obs_wave, dtype=np.float64)
+    obs_flux_norm = np.ascontiguousarray(obs_flux_norm, dtype=np.float64)
+    obs_ivar = np.ascontiguousarray(obs_ivar, dtype=np.float64)
+    model_wave = np.ascontiguousarray(model_wave, dtype=np.float64)
+    model_fluxes = np.ascontiguousarray(np.atleast_2d(model_fluxes), dtype=np.float64)
+
+    if not (obs_wave.shape == obs_flux_norm.shape == obs_ivar.shape) or model_fluxes.shape[1] != len(model_wave):
+        logging.error(f"fused 内核输入数组形状不匹配: obs={obs_flux_norm.shape}, ivar={obs_ivar.shape}, wave={obs_wave.shape}, "
+                      f"model={model_fluxes.shape}, model_wave={model_wave.shape}")
+        return np.full(len(model_fluxes), -np.inf), np.zeros(len(model_fluxes), dtype=np.int64)
+
+    if use_numba and NUMBA_AVAILABLE:
+        target_wave_clipped, lo_indices = _interpolation_indices(obs_wave, model_wave)
+        return _fused_log_likelihood_numba(target_wave_clipped, lo_indices, obs_flux_norm, obs_ivar, model_wave, model_fluxes)
+    return _fused_log_likelihood_numpy(obs_wave, obs_flux_norm, obs_ivar, model_wave, model_fluxes)
+
+
+def set_fused_kernel_threads(num_threads):
+    r"""设置当前进程中 numba 内核使用的线程数 (可作为进程池的 initializer)，numba 不可用时不做任何事."""
+    if NUMBA_AVAILABLE:
+        set_num_threads(max(1, min(int(num_threads), numba_config.NUMBA_NUM_THREADS)))
+
+
+def wavelength_window(obs_wave, model_wave):
+    r"""返回覆盖观测波长所需的最小模型波长切片，裁剪后插值结果不变."""
+    start = max(int(np.searchsorted(model_wave, np.min(obs_wave), side='left')) - 1, 0)
+    stop = min(int(np.searchsorted(model_wave, np.max(obs_wave), side='right')) + 1, len(model_wave))
+    if stop - start < 2:
+        # 观测完全落在模型范围之外时，至少保留端点处的两个点用于插值
+        start = max(min(start, len(model_wave) - 2), 0)
+        stop = min(start + 2, len(model_wave))
+    return slice(start, stop)
@@ -3,11 +3,54 @@ import numpy as np
 import os
 
 # 导入配置
-from config.settings import MIN_VALID_PIXELS
+from config.settings import MIN_VALID_PIXELS, USE_FUSED_KERNEL, FUSED_KERNEL_BATCH_SIZE, WAVE_INTERPOLATE_BOUNDS_ERROR
 
 # 导入数据加载和处理函数
 from src.loading.load_data import load_lamost_spectrum, load_phoenix_spectrum
 from src.processing.process_spectra import resample_spectrum, normalize_spectrum, calculate_log_likelihood
+from src.processing.fused_kernel import compute_log_likelihoods, wavelength_window
+
+def search_grid_fused(obs_wave, obs_flux_norm, obs_ivar, phoenix_grid, phoenix_wave, batch_size=FUSED_KERNEL_BATCH_SIZE):
+    r"""按批载入 PHOENIX 模型并用 fused 内核计算似然，返回与逐模型循环相同的最佳匹配.
+
+    Returns:
+        tuple: (最佳模型参数或 None, 最佳对数似然, 对应的有效像素点数)。
+    """
+    best_log_likelihood = -np.inf
+    best_n_valid = 0
+    best_params = None
+
+    if not np.all(np.diff(phoenix_wave) > 0):
+        logging.warning(f"源波长非单调递增，无法插值。Source wave shape: {phoenix_wave.shape}")
+        return best_params, best_log_likelihood, best_n_valid
+
+    # 只保留覆盖观测波长的模型区段，减少每批模型占用的内存
+    window = wavelength_window(obs_wave, phoenix_wave)
+    model_wave = phoenix_wave[window]
+    # 裁剪后的流量复制进预分配的数组 (切片视图会让完整的模型流量一直留在内存中)
+    batch_fluxes = np.empty((min(batch_size, len(phoenix_grid)), len(model_wave)))
+
+    for start in range(0, len(phoenix_grid), batch_size):
+        batch_params = []
+        for model_params in phoenix_grid[start:start + batch_size]:
+            phoenix_flux = load_phoenix_spectrum(model_params['filepath'])
+            if phoenix_flux is None or len(phoenix_flux) != len(phoenix_wave):
+                continue
+            batch_fluxes[len(batch_params)] = phoenix_flux[window]
+            batch_params.append(model_params)
+        if not batch_params:
+            continue
+
+        log_likelihoods, n_valids = compute_log_likelihoods(obs_wave, obs_flux_norm, obs_ivar, model_wave, batch_fluxes[:len(batch_params)])
+
+        # argmax 取第一个最大值，与逐模型循环中严格大于的比较一致
+        best_index = int(np.argmax(log_likelihoods))
+        if log_likelihoods[best_index] > best_log_likelihood:
+            best_log_likelihood = float(log_likelihoods[best_index])
+            best_n_valid = int(n_valids[best_index])
+            best_params = batch_params[best_index]
+
+    return best_params, best_log_likelihood, best_n_valid
 
 def process_spectrum_task(task_data, phoenix_grid, phoenix_wave):
     r"""处理单个 LAMOST 光谱的任务函数 (用于多进程).
@@ -58,35 +101,38 @@ def process_spectrum_task(task_data, phoenix_grid, phoenix_wave):
     best_n_valid = 0
     best_params = None
 
-    for model_params in phoenix_grid:
-        phoenix_flux = load_phoenix_spectrum(model_params['filepath'])
-        if phoenix_flux is None:
-            continue
+    if USE_FUSED_KERNEL and not WAVE_INTERPOLATE_BOUNDS_ERROR:
+        best_params, best_log_likelihood, best_n_valid = search_grid_fused(obs_wave, obs_flux_norm, obs_ivar, phoenix_grid, phoenix_wave)
+    else:
+        for model_params in phoenix_grid:
+            phoenix_flux = load_phoenix_spectrum(model_params['filepath'])
+            if phoenix_flux is None:
+                continue
             
-        if len(phoenix_flux) != len(phoenix_wave):
-            # logging.warning(f"[Worker {os.getpid()}] 跳过模型 {model_params['filepath']} (obsid={obsid}): 流量长度 ({len(phoenix_flux)}) 与波长长度 ({len(phoenix_wave)}) 不匹配。")
-            continue
+            if len(phoenix_flux) != len(phoenix_wave):
+                # logging.warning(f"[Worker {os.getpid()}] 跳过模型 {model_params['filepath']} (obsid={obsid}): 流量长度 ({len(phoenix_flux)}) 与波长长度 ({len(phoenix_wave)}) 不匹配。")
+                continue
             
-        # 重采样模型光谱到观测波长网格
-        model_flux_resampled = resample_spectrum(obs_wave, phoenix_wave, phoenix_flux)
-        if model_flux_resampled is None:
-            # 重采样失败的消息已在 resample_spectrum 中记录
-            continue
+            # 重采样模型光谱到观测波长网格
+            model_flux_resampled = resample_spectrum(obs_wave, phoenix_wave, phoenix_flux)
+            if model_flux_resampled is None:
+                # 重采样失败的消息已在 resample_spectrum 中记录
+                continue
             
-        # 归一化模型光谱
-        model_flux_norm = normalize_spectrum(model_flux_resampled)
-        if model_flux_norm is None:
-            # logging.warning(f"[Worker {os.getpid()}] 跳过模型 {model_params['filepath']} for obsid={obsid}: 模型归一化失败。")
-            continue
+            # 归一化模型光谱
+            model_flux_norm = normalize_spectrum(model_flux_resampled)
+            if model_flux_norm is None:
+                # logging.warning(f"[Worker {os.getpid()}] 跳过模型 {model_params['filepath']} for obsid={obsid}: 模型归一化失败。")
+                continue
             
-        # 计算对数似然
-        current_log_likelihood, current_n_valid = calculate_log_likelihood(obs_flux_norm, obs_ivar, model_flux_norm)
-
-        # 更新最佳匹配
-        if current_log_likelihood > best_log_likelihood:
-            best_log_likelihood = current_log_likelihood
-            best_n_valid = current_n_valid
-            best_params = model_params
+            # 计算对数似然
+            current_log_likelihood, current_n_valid = calculate_log_likelihood(obs_flux_norm, obs_ivar, model_flux_norm)
+
+            # 更新最佳匹配
+            if current_log_likelihood > best_log_likelihood:
+                best_log_likelihood = current_log_likelihood
+                best_n_valid = current_n_valid
+                best_params = model_params
 
     # --- 准备结果 --- 
     if best_params is not None:
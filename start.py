@@ -15,10 +15,13 @@ from src.loading.load_data import (
     load_lamost_catalog,
     build_catalog_lookup,
     scan_and_parse_lamost_spectra,
+    select_lamost_targets,
+    locate_lamost_spectra_from_catalog,
     build_phoenix_grid,
     load_phoenix_wavelength
 )
 from src.tasks.worker import process_spectrum_task
+from src.processing.fused_kernel import NUMBA_AVAILABLE, set_fused_kernel_threads
 
 def save_results_to_fits(results, output_path, columns, formats):
     """将结果保存到 FITS 文件."""
@@ -43,47 +46,29 @@ def save_results_to_fits(results, output_path, columns, formats):
     except Exception as e:
         logging.error(f"保存结果到 FITS 文件时出错: {e}")
 
-def main():
-    """主程序入口."""
-    setup_logging()
-    logging.info("开始执行恒星参数估计流程...")
-    logging.info(f"将使用 {settings.NUM_PROCESSES} 个工作进程。")
-    if settings.MAX_SPECTRA_TO_PROCESS is not None:
-        logging.warning(f"注意: 配置了处理数量上限 MAX_SPECTRA_TO_PROCESS = {settings.MAX_SPECTRA_TO_PROCESS}")
-
-    # --- 数据加载和预准备 --- 
-    logging.info("步骤 1/6: 扫描可用的 LAMOST 光谱文件...")
+def build_target_info(target_row):
+    """从星表行中提取子进程所需的目标信息."""
+    return {
+        'obsid': target_row.get('obsid', '未知'),
+        'ra': target_row.get('ra', np.nan),
+        'dec': target_row.get('dec', np.nan)
+    }
+
+def plan_tasks_by_scan(lamost_catalog):
+    """扫描光谱目录中的全部文件，再与星表匹配并按 class/snrg 筛选."""
+    logging.info("任务规划 1/3: 扫描可用的 LAMOST 光谱文件...")
     available_spectra_info = scan_and_parse_lamost_spectra(settings.LAMOST_SPECTRA_DIR)
     if not available_spectra_info:
         logging.error("未能找到任何可用的 LAMOST 光谱文件，程序退出。")
-        return 
-
-    logging.info("步骤 2/6: 加载 LAMOST 星表...")
-    lamost_catalog = load_lamost_catalog(settings.LAMOST_CATALOG_PATH)
-    if lamost_catalog is None:
-        logging.error("加载 LAMOST 星表失败，程序退出。")
-        return
+        return None
 
-    logging.info("步骤 3/6: 构建星表查找字典...")
+    logging.info("任务规划 2/3: 构建星表查找字典...")
     catalog_lookup = build_catalog_lookup(lamost_catalog)
     if catalog_lookup is None:
         logging.error("构建星表查找字典失败，程序退出。")
-        return
+        return None
 
-    logging.info("步骤 4/6: 构建 PHOENIX 模型网格...")
-    phoenix_grid = build_phoenix_grid(settings.PHOENIX_SPECTRA_DIR)
-    if phoenix_grid is None:
-        logging.error("构建 PHOENIX 模型网格失败，程序退出。")
-        return
-
-    logging.info("步骤 5/6: 加载 PHOENIX 波长...")
-    phoenix_wave = load_phoenix_wavelength(settings.PHOENIX_WAVE_PATH)
-    if phoenix_wave is None:
-        logging.error("无法加载 PHOENIX 波长，程序退出。")
-        return
-
-    # --- 预筛选任务 --- 
-    logging.info("步骤 6/6: 预筛选光谱任务...")
+    logging.info("任务规划 3/3: 预筛选光谱任务...")
     tasks_to_process = []
     skipped_match_fail = 0
     skipped_filter_fail = 0
@@ -127,14 +112,7 @@ def main():
                 skipped_filter_fail += 1
                 continue
             
-            # 创建子进程所需的信息字典
-            target_info = {
-                'obsid': obsid,
-                'ra': target_row.get('ra', np.nan),
-                'dec': target_row.get('dec', np.nan)
-            }
-            
-            tasks_to_process.append({'spec_info': spec_info, 'target_info': target_info})
+            tasks_to_process.append({'spec_info': spec_info, 'target_info': build_target_info(target_row)})
 
             # 检查是否达到处理上限
             if settings.MAX_SPECTRA_TO_PROCESS is not None and len(tasks_to_process) >= settings.MAX_SPECTRA_TO_PROCESS:
@@ -147,13 +125,85 @@ def main():
             skipped_filter_fail += 1
             continue
             
-    num_tasks_final = len(tasks_to_process)
-    logging.info(f"预筛选完成。共 {num_tasks_final} 个任务待处理。")
+    logging.info(f"预筛选完成。共 {len(tasks_to_process)} 个任务待处理。")
     logging.info(f"(预筛选期间: {skipped_match_fail} 个无法匹配星表, {skipped_filter_fail} 个未通过 class/snrg 筛选)")
+    return tasks_to_process
+
+def plan_tasks_from_catalog(lamost_catalog):
+    """先在星表上按 class/snrg 筛选，再只检查筛选出的目标对应的光谱文件."""
+    logging.info("任务规划 1/2: 在星表上筛选目标...")
+    row_indices = select_lamost_targets(lamost_catalog, settings.TARGET_CLASS, settings.MIN_SNRG)
+    if row_indices is None:
+        logging.error("星表筛选失败，程序退出。")
+        return None
+
+    logging.info("任务规划 2/2: 检查目标对应的 LAMOST 光谱文件...")
+    available_spectra_info = locate_lamost_spectra_from_catalog(
+        lamost_catalog,
+        row_indices,
+        settings.LAMOST_SPECTRA_DIR,
+        max_spectra=settings.MAX_SPECTRA_TO_PROCESS,
+        num_threads=settings.PATH_CHECK_THREADS
+    )
+    if not available_spectra_info:
+        logging.error("未能找到任何可用的 LAMOST 光谱文件，程序退出。")
+        return None
+
+    tasks_to_process = []
+    for spec_info in available_spectra_info:
+        target_row = lamost_catalog[spec_info['row_index']]
+        tasks_to_process.append({'spec_info': spec_info, 'target_info': build_target_info(target_row)})
+
+    logging.info(f"任务规划完成。共 {len(tasks_to_process)} 个任务待处理。")
+    return tasks_to_process
+
+def main():
+    """主程序入口."""
+    setup_logging()
+    logging.info("开始执行恒星参数估计流程...")
+    logging.info(f"将使用 {settings.NUM_PROCESSES} 个工作进程。")
+    if settings.USE_FUSED_KERNEL and not settings.WAVE_INTERPOLATE_BOUNDS_ERROR:
+        if NUMBA_AVAILABLE:
+            logging.info(f"已启用 fused 似然内核 (numba 编译版本)，每个工作进程使用 {settings.FUSED_KERNEL_NUM_THREADS} 个线程。")
+        else:
+            logging.warning("已启用 fused 似然内核，但未安装 numba，将使用 NumPy 实现。")
+    if settings.MAX_SPECTRA_TO_PROCESS is not None:
+        logging.warning(f"注意: 配置了处理数量上限 MAX_SPECTRA_TO_PROCESS = {settings.MAX_SPECTRA_TO_PROCESS}")
+
+    # --- 数据加载和预准备 --- 
+    logging.info("步骤 1/4: 加载 LAMOST 星表...")
+    lamost_catalog = load_lamost_catalog(settings.LAMOST_CATALOG_PATH)
+    if lamost_catalog is None:
+        logging.error("加载 LAMOST 星表失败，程序退出。")
+        return
+
+    logging.info(f"步骤 2/4: 规划光谱任务 (TASK_PLANNING_MODE = '{settings.TASK_PLANNING_MODE}')...")
+    if settings.TASK_PLANNING_MODE == 'catalog':
+        tasks_to_process = plan_tasks_from_catalog(lamost_catalog)
+    elif settings.TASK_PLANNING_MODE == 'scan':
+        tasks_to_process = plan_tasks_by_scan(lamost_catalog)
+    else:
+        logging.error(f"未知的 TASK_PLANNING_MODE: {settings.TASK_PLANNING_MODE} (可选 'catalog' 或 'scan')，程序退出。")
+        return
+    if tasks_to_process is None:
+        return
 
     if not tasks_to_process:
         logging.info("没有需要处理的任务，程序结束。")
         return
+    num_tasks_final = len(tasks_to_process)
+
+    logging.info("步骤 3/4: 构建 PHOENIX 模型网格...")
+    phoenix_grid = build_phoenix_grid(settings.PHOENIX_SPECTRA_DIR)
+    if phoenix_grid is None:
+        logging.error("构建 PHOENIX 模型网格失败，程序退出。")
+        return
+
+    logging.info("步骤 4/4: 加载 PHOENIX 波长...")
+    phoenix_wave = load_phoenix_wavelength(settings.PHOENIX_WAVE_PATH)
+    if phoenix_wave is None:
+        logging.error("无法加载 PHOENIX 波长，程序退出。")
+        return
 
     # --- 使用多进程处理任务 --- 
     results = []
@@ -164,7 +214,12 @@ def main():
     chunksize = max(1, num_tasks_final // (settings.NUM_PROCESSES * 4))
     logging.info(f"多进程池 chunksize 设置为: {chunksize}")
 
-    with multiprocessing.Pool(processes=settings.NUM_PROCESSES) as pool:
+    # 限制每个工作进程内 numba 内核的线程数，避免与进程池叠加后超额占用 CPU
+    with multiprocessing.Pool(
+        processes=settings.NUM_PROCESSES,
+        initializer=set_fused_kernel_threads,
+        initargs=(settings.FUSED_KERNEL_NUM_THREADS,)
+    ) as pool:
         # 使用 tqdm 显示进度条
         imap_results = pool.imap_unordered(worker_func, tasks_to_process, chunksize=chunksize)
         